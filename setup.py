@@ -3,12 +3,15 @@ import os
 import re
 
 
+VERSION_RE = re.compile(r"^__version__ = ['\"]([^'\"]*)['\"]", re.M)
+
+
 def read_version():
     """Read the version from the package __init__.py file without importing the package."""
     here = os.path.abspath(os.path.dirname(__file__))
-    init_py = open(os.path.join(here, 'utils', '__init__.py')).read()
-    version_match = re.search(
-        r"^__version__ = ['\"]([^'\"]*)['\"]", init_py, re.M)
+    with open(os.path.join(here, 'utils', '__init__.py'), encoding='UTF8') as init_file:
+        init_py = init_file.read()
+    version_match = VERSION_RE.search(init_py)
     if version_match:
         return version_match.group(1)
     raise RuntimeError("Unable to find version string.")
@@ -17,6 +20,7 @@ def read_version():
 setup(
     name="video_utils",
     version=read_version(),
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests', 'tests.*']),
+    python_requires='>=3.9',
     entry_points={'console_scripts': ['video-utils-cli=utils.concat:main']}
 )
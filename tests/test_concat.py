@@ -0,0 +1,193 @@
+import os
+import struct
+
+from utils import concat
+from utils.concat import (FileInfo, _is_hevc_aac, _join_file_entry, _read_mp4_duration,
+                          can_stream_copy, collect_files, natural_sort_key, write_join_file)
+
+
+def box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def large_box(box_type, payload):
+    return struct.pack('>I4sQ', 1, box_type, 16 + len(payload)) + payload
+
+
+def mvhd_v0(timescale, duration):
+    return box(b'mvhd', b'\x00\x00\x00\x00'
+               + struct.pack('>IIII', 0, 0, timescale, duration) + b'\x00' * 80)
+
+
+def mvhd_v1(timescale, duration):
+    return box(b'mvhd', b'\x01\x00\x00\x00'
+               + struct.pack('>QQIQ', 0, 0, timescale, duration) + b'\x00' * 80)
+
+
+def write_mp4(tmp_path, *boxes):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(box(b'ftyp', b'isom' * 4) + b''.join(boxes))
+    return str(path)
+
+
+def test_read_mp4_duration_v0(tmp_path):
+    filename = write_mp4(tmp_path, box(b'mdat', b'x' * 100),
+                         box(b'moov', box(b'udta', b'') + mvhd_v0(1000, 12345)))
+    assert _read_mp4_duration(filename) == 12.345
+
+
+def test_read_mp4_duration_v1(tmp_path):
+    filename = write_mp4(tmp_path, box(b'moov', mvhd_v1(600, 6000)))
+    assert _read_mp4_duration(filename) == 10.0
+
+
+def test_read_mp4_duration_64_bit_box_size(tmp_path):
+    filename = write_mp4(tmp_path, large_box(b'mdat', b'x' * 100),
+                         large_box(b'moov', mvhd_v0(90000, 450000)))
+    assert _read_mp4_duration(filename) == 5.0
+
+
+def test_read_mp4_duration_fragmented_file_is_unknown(tmp_path):
+    filename = write_mp4(tmp_path, box(b'moov', mvhd_v0(1000, 0)), box(b'moof', b''))
+    assert _read_mp4_duration(filename) is None
+
+
+def test_read_mp4_duration_all_ones_is_unknown(tmp_path):
+    filename = write_mp4(tmp_path, box(b'moov', mvhd_v1(1000, 0xFFFFFFFFFFFFFFFF)))
+    assert _read_mp4_duration(filename) is None
+
+
+def test_read_mp4_duration_without_moov(tmp_path):
+    filename = write_mp4(tmp_path, box(b'mdat', b'x' * 100))
+    assert _read_mp4_duration(filename) is None
+
+
+def test_read_mp4_duration_not_an_mp4(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'garbage')
+    assert _read_mp4_duration(str(path)) is None
+
+
+def test_file_info_keeps_splitext_attributes():
+    file_info = FileInfo('./video.mp4', None, None)
+    assert file_info.filename_without_extension == './video'
+    assert file_info.extension == '.mp4'
+    assert file_info.trimmed_video_filename() == 'video_trimmed.mp4'
+
+
+def test_file_info_accepts_names_without_stem():
+    assert FileInfo('', None, None).trimmed_video_filename() == '_trimmed'
+    assert FileInfo('.', None, None).trimmed_video_filename() == '._trimmed'
+
+
+def test_natural_sort_key_orders_numbers_numerically():
+    names = ['join10__a.mp4', 'join2__a.mp4', 'join1__a.mp4', 'join01__a.mp4']
+    assert sorted(names, key=natural_sort_key) == [
+        'join01__a.mp4', 'join1__a.mp4', 'join2__a.mp4', 'join10__a.mp4']
+
+
+def test_write_join_file_returns_false_when_unchanged(tmp_path):
+    join_filename = str(tmp_path / 'join.txt')
+    assert write_join_file(join_filename, ['a.mp4', 'b.mp4'], comment='options')
+    assert not write_join_file(join_filename, ['a.mp4', 'b.mp4'], comment='options')
+    assert write_join_file(join_filename, ['a.mp4', 'b.mp4'], comment='other options')
+
+
+CONFIG = {'files': {0: {'name': 'a.mp4'}, 1: {'name': 'b.mp4'}}}
+
+
+def make_inputs_and_output(tmp_path):
+    for name in ('a.mp4', 'b.mp4'):
+        (tmp_path / name).write_bytes(b'')
+    output = tmp_path / 'output.mp4'
+    output.write_bytes(b'')
+    inputs_mtime = os.stat(tmp_path / 'a.mp4').st_mtime_ns
+    os.utime(output, ns=(inputs_mtime + 10**9, inputs_mtime + 10**9))
+
+
+def test_process_config_skips_concat_when_output_is_up_to_date(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(concat, 'can_stream_copy', lambda filenames: False)
+    concat_calls = []
+
+    def do_concat(*args, **kwargs):
+        concat_calls.append(args)
+        return 0
+
+    monkeypatch.setattr(concat, 'do_concat', do_concat)
+    make_inputs_and_output(tmp_path)
+
+    concat.process_config(CONFIG, skip_encode=False)
+    concat.process_config(CONFIG, skip_encode=False)
+    assert len(concat_calls) == 1
+
+    # changing the options regenerates the output even though it exists
+    concat.process_config(CONFIG, skip_encode=True)
+    assert len(concat_calls) == 2
+
+
+def test_process_config_removes_join_file_when_concat_fails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(concat, 'can_stream_copy', lambda filenames: False)
+    monkeypatch.setattr(concat, 'do_concat', lambda *args, **kwargs: 1)
+    make_inputs_and_output(tmp_path)
+
+    concat.process_config(CONFIG, skip_encode=False)
+    assert not (tmp_path / 'join.txt').exists()
+
+
+def test_collect_files_includes_symlinks_and_skips_directories(tmp_path):
+    (tmp_path / 'a.mp4').write_bytes(b'')
+    (tmp_path / 'link10.mp4').symlink_to(tmp_path / 'a.mp4')
+    (tmp_path / 'dir.mp4').mkdir()
+    (tmp_path / 'b.mp4.part').write_bytes(b'')
+    assert collect_files(str(tmp_path)) == ['a.mp4', 'link10.mp4']
+
+
+def test_join_file_entry_escapes_single_quotes():
+    assert _join_file_entry("it's.mp4") == "file 'it'\\''s.mp4'\n"
+
+
+def test_join_file_entry_writes_trim_points():
+    assert _join_file_entry(FileInfo('a.mp4', '00:00:10', None)) == (
+        "file 'a.mp4'\ninpoint 00:00:10\n")
+    assert _join_file_entry(FileInfo('a.mp4', None, '00:00:20')) == (
+        "file 'a.mp4'\noutpoint 00:00:20\n")
+    assert _join_file_entry(FileInfo('a.mp4', '00:00:10', '00:00:20')) == (
+        "file 'a.mp4'\ninpoint 00:00:10\noutpoint 00:00:20\n")
+    assert _join_file_entry(FileInfo('a.mp4', None, None)) == "file 'a.mp4'\n"
+
+
+def video_stream(codec):
+    return ('video', codec, 1920, 1080, 'yuv420p', '30/1', None, None)
+
+
+def audio_stream(codec):
+    return ('audio', codec, None, None, None, '0/0', '48000', 2)
+
+
+def test_is_hevc_aac():
+    assert _is_hevc_aac((video_stream('hevc'), audio_stream('aac')))
+    assert _is_hevc_aac((video_stream('hevc'),))
+    assert not _is_hevc_aac((video_stream('h264'), audio_stream('aac')))
+    assert not _is_hevc_aac((video_stream('hevc'), audio_stream('pcm_s16le')))
+    assert not _is_hevc_aac((audio_stream('aac'),))
+
+
+def test_can_stream_copy(monkeypatch):
+    params = {
+        'hevc.mp4': (video_stream('hevc'), audio_stream('aac')),
+        'hevc2.mp4': (video_stream('hevc'), audio_stream('aac')),
+        'hevc_mono.mp4': (video_stream('hevc'),
+                          ('audio', 'aac', None, None, None, '0/0', '48000', 1)),
+        'prores.mov': (video_stream('prores'), audio_stream('pcm_s16le')),
+        'prores2.mov': (video_stream('prores'), audio_stream('pcm_s16le')),
+        'broken.mp4': None,
+    }
+    monkeypatch.setattr(concat, 'get_stream_params', params.get)
+
+    assert can_stream_copy(['hevc.mp4', 'hevc2.mp4'])
+    assert not can_stream_copy(['hevc.mp4', 'hevc_mono.mp4'])
+    assert not can_stream_copy(['prores.mov', 'prores2.mov'])
+    assert not can_stream_copy(['hevc.mp4', 'broken.mp4'])
+    assert not can_stream_copy([])
@@ -3,12 +3,16 @@ This module is a simple wrapper around ffmpeg. It's main purpose is to simplify
 of concatenating video files.
 """
 
+import functools
+import json
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 import os
+import pathlib
 import re
+import struct
 import logging
 import click
-import yaml
 from utils import __version__
 
 
@@ -28,6 +32,9 @@ class FileInfo:
         trimmed_video_filename(): Generates the filename for the trimmed video.
     """
 
+    __slots__ = ('filename', 'start_ts', 'end_ts', 'filename_without_extension', 'extension',
+                 'is_trimmed', '_trimmed_name')
+
     def __init__(self, filename, start_ts, end_ts):
         self.filename = filename
         self.start_ts = start_ts
@@ -35,6 +42,12 @@ class FileInfo:
         self.filename_without_extension, self.extension = os.path.splitext(
             self.filename)
         self.is_trimmed = False
+        path = pathlib.PurePath(filename)
+        if path.name:
+            self._trimmed_name = str(path.with_stem(path.stem + "_trimmed"))
+        else:
+            # names such as '' or '.' have no stem for pathlib to work with
+            self._trimmed_name = self.filename_without_extension + "_trimmed" + self.extension
 
     def trimmed_video_filename(self):
         """
@@ -42,59 +55,403 @@ class FileInfo:
 
         Returns:
             str: The filename for the trimmed video, appending '_trimmed' before the file extension.
+                 The path is normalised, e.g. './video.mp4' gives 'video_trimmed.mp4'.
         """
-        return self.filename_without_extension + "_trimmed" + self.extension
+        return self._trimmed_name
+
+
+@functools.lru_cache(maxsize=32)
+def _compile(pattern):
+    """
+    Compiles a regular expression, caching the result so repeated calls with the same
+    pattern don't pay the compilation cost again.
+    """
+    return re.compile(pattern)
+
+
+_DIGITS_RE = re.compile(r'(\d+)')
+
+# default for collect_files: any mp4 file in the directory
+_MP4_RE = re.compile(r"[^/]*\.mp4\Z")
+
+
+def natural_sort_key(filename):
+    """
+    Sort key which orders embedded numbers numerically, so 'join2__a.mp4' sorts before
+    'join10__a.mp4'.
+
+    Args:
+        filename (str): The filename to compute the key for.
+
+    Returns:
+        tuple: The text parts of the filename with the digit runs converted to ints, and the
+               filename itself to order names whose numbers only differ in leading zeros.
+    """
+    parts = _DIGITS_RE.split(filename)
+    parts[1::2] = [int(number) for number in parts[1::2]]
+    return parts, filename
 
 
-def collect_files(directory, pattern):
+def collect_files(directory, pattern=None, extension=None):
     """
     Collect files in a directory that match a specified pattern.
 
     Args:
     - directory (str): The directory path to search for files.
-    - pattern (str): The regular expression pattern to match filenames.
+    - pattern (str or re.Pattern, optional): The regular expression pattern to match
+      filenames. Defaults to any filename ending in '.mp4'.
+    - extension (str, optional): If given, only filenames ending with this extension are
+      matched against the pattern. This is a cheap check that avoids running the regex
+      on entries which can never match. Defaults to '.mp4' when no pattern is given.
 
     Returns:
-    - list: A list of filenames that match the specified pattern.
+    - list: A list of filenames that match the specified pattern, sorted with numbers in
+      the names compared numerically. Directories are skipped.
     """
-    regex = re.compile(pattern)
-    files = os.listdir(path=directory)
-    filtered_files = [f for f in files if regex.match(f)]
+    if pattern is None:
+        regex = _MP4_RE
+        if extension is None:
+            extension = '.mp4'
+    elif isinstance(pattern, re.Pattern):
+        regex = pattern
+    else:
+        regex = _compile(pattern)
 
-    logging.debug('Found files in directory: %s', files)
-    logging.debug('Found files to join: %s', filtered_files)
+    with os.scandir(directory) as entries:
+        filtered_files = [entry.name for entry in entries
+                          if (extension is None or entry.name.endswith(extension))
+                          and entry.is_file()
+                          and regex.match(entry.name)]
+    # directory order is arbitrary, but concatenation order must be deterministic
+    filtered_files.sort(key=natural_sort_key)
+
+    logging.debug('Found files to join, in concatenation order: %s', filtered_files)
     return filtered_files
 
 
-def get_video_duration_seconds():
+def _find_mp4_box(mp4_file, box_type, end):
+    """
+    Scans the boxes between the current file position and `end` for one of the given type.
+
+    Returns:
+        tuple: The (payload_start, payload_end) offsets of the box, or None if it wasn't found.
+    """
+    position = mp4_file.tell()
+    while position + 8 <= end:
+        header = mp4_file.read(8)
+        if len(header) < 8:
+            return None
+        size, current_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            largesize = mp4_file.read(8)
+            if len(largesize) < 8:
+                return None
+            size = struct.unpack('>Q', largesize)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size:
+            return None
+        if current_type == box_type:
+            return position + header_size, position + size
+        position += size
+        mp4_file.seek(position)
+    return None
+
+
+def _read_mp4_duration(filename):
     """
-    Uses `ffprobe` to retrieve the duration of the output file.
+    Reads the duration of an mp4/mov file from its `moov/mvhd` box.
+
+    Returns:
+        float: The duration in seconds, or None if the file couldn't be parsed.
+    """
+    try:
+        with open(filename, 'rb') as mp4_file:
+            file_size = os.fstat(mp4_file.fileno()).st_size
+            moov = _find_mp4_box(mp4_file, b'moov', file_size)
+            if moov is None:
+                return None
+            mp4_file.seek(moov[0])
+            mvhd = _find_mp4_box(mp4_file, b'mvhd', moov[1])
+            if mvhd is None:
+                return None
+            mp4_file.seek(mvhd[0])
+            version = mp4_file.read(4)[:1]
+            if version == b'\x00':
+                # creation time, modification time, timescale, duration
+                fields = mp4_file.read(16)
+                if len(fields) < 16:
+                    return None
+                _, _, timescale, duration = struct.unpack('>IIII', fields)
+                unknown_duration = 0xFFFFFFFF
+            elif version == b'\x01':
+                fields = mp4_file.read(28)
+                if len(fields) < 28:
+                    return None
+                _, _, timescale, duration = struct.unpack('>QQIQ', fields)
+                unknown_duration = 0xFFFFFFFFFFFFFFFF
+            else:
+                return None
+    except OSError:
+        return None
+
+    # fragmented files store 0 in mvhd and keep the real duration in the fragments
+    if not timescale or duration in (0, unknown_duration):
+        return None
+    return duration / timescale
+
+
+# Probed durations keyed by (path, size, mtime_ns), so a rewritten file is probed again.
+_duration_cache = {}
+
+
+def get_video_duration_seconds(filename="output.mp4"):
+    """
+    Retrieves the duration of a video file, by default the concatenated output file.
+
+    The duration is read directly from the mp4 container header. If that fails, for
+    example because the file isn't an mp4, `ffprobe` is used instead. Results are cached
+    until the size or modification time of the file changes.
+
+    Args:
+        filename (str): The name of the video file to probe.
+
+    Returns:
+        float: The duration of the video in seconds.
+
+    Raises:
+        RuntimeError: If neither the mp4 header nor `ffprobe` gives a duration.
+    """
+    stat = os.stat(filename)
+    cache_key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    if cache_key in _duration_cache:
+        return _duration_cache[cache_key]
+
+    duration = _read_mp4_duration(filename)
+    if duration is None:
+        logging.debug('Could not read duration of %s from mp4 header, using ffprobe.', filename)
+        # files which get here have no usable header duration, so let ffprobe probe the
+        # streams as far as it needs to
+        duration_run = subprocess.run([
+            "ffprobe",
+            "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "json", filename],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=False)
+        try:
+            if duration_run.returncode != 0:
+                raise ValueError(duration_run.stderr.strip())
+            duration = float(json.loads(duration_run.stdout)['format']['duration'])
+        except (ValueError, KeyError, TypeError) as error:
+            raise RuntimeError(
+                f"ffprobe could not read the duration of {filename}: {error}") from error
+
+    _duration_cache[cache_key] = duration
+    return duration
+
+
+def get_video_durations(filenames):
+    """
+    Retrieves the durations of several video files.
+
+    mp4 headers are parsed in-process, so probing many files doesn't spawn a process per
+    file; `ffprobe` is only run for files whose header can't be read.
+
+    Args:
+        filenames (list): The names of the video files to probe.
+
+    Returns:
+        dict: The duration in seconds of each file, keyed by filename.
+    """
+    return {filename: get_video_duration_seconds(filename) for filename in filenames}
+
+
+def get_stream_params(filename):
     """
-    duration_run = subprocess.run([
+    Uses `ffprobe` to retrieve the stream parameters which decide whether files can be
+    concatenated without re-encoding.
+
+    Args:
+        filename (str): The name of the video file to probe.
+
+    Returns:
+        tuple: One tuple of (codec_type, codec_name, width, height, pix_fmt, r_frame_rate,
+               sample_rate, channels) per stream, or None if the file couldn't be probed.
+    """
+    probe_run = subprocess.run([
         "ffprobe",
         "-v", "error",
-        "-show_entries", "format=duration", "-of",
-        "default=noprint_wrappers=1:nokey=1", "output.mp4"],
+        "-show_entries",
+        "stream=codec_type,codec_name,width,height,pix_fmt,r_frame_rate,sample_rate,channels",
+        "-of", "json", filename],
         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=False)
+    if probe_run.returncode != 0:
+        return None
 
-    duration = float(duration_run.stdout)
-    return duration
+    try:
+        streams = json.loads(probe_run.stdout)['streams']
+    except (ValueError, KeyError):
+        return None
+
+    return tuple(
+        (stream.get('codec_type'), stream.get('codec_name'), stream.get('width'),
+         stream.get('height'), stream.get('pix_fmt'), stream.get('r_frame_rate'),
+         stream.get('sample_rate'), stream.get('channels'))
+        for stream in streams)
+
+
+def _is_hevc_aac(params):
+    """
+    Checks whether probed stream parameters describe HEVC video with, optionally, AAC audio,
+    which is what the encode path of `do_concat` produces.
+    """
+    codecs = {codec_type: set() for codec_type in ('video', 'audio')}
+    for stream in params:
+        if stream[0] in codecs:
+            codecs[stream[0]].add(stream[1])
+    return codecs['video'] == {'hevc'} and codecs['audio'] <= {'aac'}
+
+
+def can_stream_copy(filenames):
+    """
+    Checks whether video files can be concatenated with `-c copy`, i.e. whether all of them
+    share the same codecs and stream parameters and are already HEVC video with AAC audio,
+    so copying gives the same kind of output as re-encoding would.
+
+    Args:
+        filenames (list): The names of the video files to concatenate.
+
+    Returns:
+        bool: True if every file could be probed and all stream parameters match.
+    """
+    filenames = list(filenames)
+    if not filenames:
+        return False
+
+    # each probe is a separate ffprobe process, so threads are enough to overlap them
+    first_params = None
+    with ThreadPoolExecutor(max_workers=min(len(filenames), os.cpu_count() or 1)) as executor:
+        for filename, params in zip(filenames, executor.map(get_stream_params, filenames)):
+            if not params or (first_params is not None and params != first_params):
+                logging.debug('Stream parameters of %s differ: %s', filename, params)
+                executor.shutdown(cancel_futures=True)
+                return False
+            first_params = params
+    if not _is_hevc_aac(first_params):
+        logging.debug('Input files are not HEVC/AAC, re-encoding: %s', first_params)
+        return False
+    return True
+
+
+def _escape_concat_path(filename):
+    """
+    Escapes a filename for use inside single quotes in an ffmpeg concat list. A quote can't
+    appear inside a quoted string, so it is closed, an escaped quote added, and reopened.
+    """
+    return filename.replace("'", "'\\''")
+
+
+def _join_file_entry(file):
+    """
+    Formats a single entry of the ffmpeg concat list. FileInfo objects with timestamps get
+    `inpoint`/`outpoint` directives so the concat demuxer trims them while reading.
+    """
+    if not isinstance(file, FileInfo):
+        return f"file '{_escape_concat_path(file)}'\n"
+
+    entry = f"file '{_escape_concat_path(file.filename)}'\n"
+    if file.start_ts:
+        entry += f"inpoint {file.start_ts}\n"
+    if file.end_ts:
+        entry += f"outpoint {file.end_ts}\n"
+    return entry
 
 
-def write_join_file(join_filename, files):
+def write_join_file(join_filename, files, comment=None):
     """
     Writes filenames to a text file which ffmpeg uses to determine which video files to
-    concatenate.
+    concatenate. The file is left untouched if it already has the same contents.
+
+    Args:
+        join_filename (str): The name of the join file to write.
+        files (list): Filenames, or FileInfo objects whose start and end timestamps are
+                      written as `inpoint`/`outpoint` so no separate trim pass is needed.
+        comment (str, optional): A comment written to the top of the file. ffmpeg ignores
+                                 it, but it takes part in the comparison with the old file.
+
+    Returns:
+        bool: True if the file was written, False if it already had these contents.
+    """
+    files = list(files)
+    payload = "".join(_join_file_entry(file) for file in files)
+    if comment:
+        payload = f"# {comment}\n" + payload
+    logging.info('Adding %d files to the process queue.', len(files))
+    logging.debug('Join file contents:\n%s', payload)
+
+    data = payload.encode('UTF8')
+    try:
+        with open(join_filename, 'rb') as join_file:
+            if join_file.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+
+    # the file is written once, so skip the buffered text layer and write the bytes directly
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+    join_fd = os.open(join_filename, flags, 0o644)
+    try:
+        written = 0
+        while written < len(data):
+            written += os.write(join_fd, data[written:])
+    finally:
+        os.close(join_fd)
+    return True
+
+
+def _is_newer_than(output_filename, filenames):
+    """
+    Checks whether a file exists and was modified after all of the given files.
+    """
+    try:
+        output_mtime = os.stat(output_filename).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    try:
+        return all(os.stat(filename).st_mtime_ns <= output_mtime for filename in filenames)
+    except FileNotFoundError:
+        # let ffmpeg report the missing input
+        return False
+
+
+def _ffmpeg_base_cmd():
+    """
+    Returns the arguments every ffmpeg command starts with.
+
+    ffmpeg never reads from stdin, doesn't print its banner, and only logs warnings unless
+    debug logging is enabled. The progress line is normally logged at info level, so
+    `-stats` is passed to keep it visible at the lower log level. Without stdin ffmpeg
+    can't ask before overwriting an existing output, so `-y` is passed; callers decide
+    themselves when an output needs to be regenerated.
     """
-    with open(join_filename, "w", encoding='UTF8') as join_txt:
-        for filename in files:
-            logging.info('Adding %s to the process queue.', filename)
-            join_txt.write(f"file '{filename}'\n")
+    loglevel = "info" if logging.getLogger().isEnabledFor(logging.DEBUG) else "warning"
+    return ["ffmpeg", "-y", "-nostdin", "-hide_banner", "-loglevel", loglevel, "-stats"]
 
 
-def do_concat(join_filename, output_filename, skip_encode=False):
+def do_concat(join_filename, output_filename, skip_encode=False, hw_decode=True,
+              video_tag=None):
     """
     Concatenate video files using ffmpeg
+
+    When re-encoding, the inputs are decoded with NVDEC (`-hwaccel cuda`) and the decoded
+    frames stay in GPU memory until `hevc_nvenc` encodes them. This requires inputs in a
+    codec NVDEC can decode (e.g. H.264, HEVC, VP9, AV1); pass `hw_decode=False` to decode
+    on the CPU instead.
+
+    When stream copying, `video_tag` sets the codec tag of the copied video stream, e.g.
+    'hvc1' for HEVC so the output plays in the same players as the encoded output.
     """
     ffmpeg_encode_args = [
         "-vf", "select=concatdec_select",
@@ -114,18 +471,30 @@ def do_concat(join_filename, output_filename, skip_encode=False):
         "-c", "copy",
         output_filename
     ]
+    if video_tag:
+        ffmpeg_no_encode_args[-1:-1] = ["-tag:v", video_tag]
+
+    ffmpeg_hw_decode_args = [
+        "-hwaccel", "cuda",
+        "-hwaccel_output_format", "cuda"
+    ]
 
-    ffmpeg_base_cmd = [
-        "ffmpeg",
+    ffmpeg_base_cmd = _ffmpeg_base_cmd() + [
         "-f", "concat",
-        "-safe", "0",
+        "-safe", "0"
+    ]
+
+    ffmpeg_input_args = [
         "-i", f"{os.path.join('.', join_filename)}"
     ]
 
     if skip_encode:
-        ffmpeg_cmd = ffmpeg_base_cmd + ffmpeg_no_encode_args
+        ffmpeg_cmd = ffmpeg_base_cmd + ffmpeg_input_args + ffmpeg_no_encode_args
+    elif hw_decode:
+        ffmpeg_cmd = (ffmpeg_base_cmd + ffmpeg_hw_decode_args + ffmpeg_input_args
+                      + ffmpeg_encode_args)
     else:
-        ffmpeg_cmd = ffmpeg_base_cmd + ffmpeg_encode_args
+        ffmpeg_cmd = ffmpeg_base_cmd + ffmpeg_input_args + ffmpeg_encode_args
 
     logging.debug('Concatenation command args: %s', ffmpeg_cmd)
 
@@ -155,14 +524,15 @@ def do_trim(file_info: FileInfo, output_name,):
         if return_code == 0:
             print("Trimming successful")
     """
-    trim_cmd = ["ffmpeg",
-                "-loglevel", "warning",
-                "-ss", file_info.start_ts if file_info.start_ts else "00:00:00",
-                "-i", file_info.filename,
-                "-c", "copy", output_name]
+    trim_cmd = _ffmpeg_base_cmd() + [
+        "-ss", file_info.start_ts if file_info.start_ts else "00:00:00"]
 
     if file_info.end_ts:
-        trim_cmd[3:3] = ["-to", file_info.end_ts]
+        trim_cmd += ["-to", file_info.end_ts]
+
+    trim_cmd += ["-i", file_info.filename,
+                 "-c", "copy",
+                 "-avoid_negative_ts", "make_zero", output_name]
 
     logging.debug('Trim command args: %s', trim_cmd)
     run = subprocess.run(trim_cmd, check=True)
@@ -179,16 +549,19 @@ def do_trim_from_end(video_to_trim, from_ts, trim_end_secs=None):
         from_ts (str): Video content before this timestamp is cut. HH:MM:SS
         trim_end_secs (float): Number of seconds from the end of the video to cut.
     """
-    trim_cmd = ["ffmpeg", "-ss", from_ts, "-i",
-                video_to_trim, "-c", "copy", "output_trimmed.mp4"]
+    trim_cmd = _ffmpeg_base_cmd() + ["-ss", from_ts]
     if trim_end_secs:
-        duration = get_video_duration_seconds()
+        duration = get_video_duration_seconds(video_to_trim)
 
-        trim_cmd[3:3] = ["-to", str(duration - float(trim_end_secs))]
+        trim_cmd += ["-to", str(duration - float(trim_end_secs))]
 
         logging.debug(
             'Trimming last %s seconds from output (originally %s seconds).', trim_end_secs, duration)
 
+    trim_cmd += ["-i", video_to_trim,
+                 "-c", "copy",
+                 "-avoid_negative_ts", "make_zero", "output_trimmed.mp4"]
+
     logging.debug('Trim command args: %s', trim_cmd)
 
     run = subprocess.run(trim_cmd, check=False)
@@ -196,23 +569,33 @@ def do_trim_from_end(video_to_trim, from_ts, trim_end_secs=None):
 
 
 def write_yaml(data, filename):
+    # imported here so runs which don't touch the config file skip loading PyYAML
+    import yaml  # pylint: disable=import-outside-toplevel
+
     with open(filename, 'w', encoding='UTF8') as file:
         yaml.dump(data, file, sort_keys=False, default_flow_style=False)
 
 
 def read_yaml(filename):
+    import yaml  # pylint: disable=import-outside-toplevel
+
+    # the libyaml based loader is much faster, but only exists if PyYAML was built with it
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
     with open(filename, 'r', encoding='UTF8') as config_file:
-        config_dict = yaml.safe_load(config_file)
+        config_dict = yaml.load(config_file, Loader=loader)
     return config_dict
 
 
-def process_config(config_dict, skip_encode):
+def process_config(config_dict, skip_encode, force_reencode=False, hw_decode=True):
     """
     Processes a configuration dictionary to trim and concatenate video files as specified.
 
     Args:
         config_dict (dict): A dictionary containing the configuration for processing video files.
                             It should have a 'files' key with file configurations.
+        skip_encode (bool): Concatenate with `-c copy` instead of re-encoding.
+        force_reencode (bool): Re-encode even when the files could be stream copied.
+        hw_decode (bool): Decode with NVDEC when re-encoding, see `do_concat`.
 
     Example structure of `config_dict`:
         {
@@ -232,16 +615,21 @@ def process_config(config_dict, skip_encode):
         1. Iterates over each file configuration in `config_dict['files']`.
         2. Creates a FileInfo object for each file.
         3. Logs the file details.
-        4. Trims the file if start or end timestamps are specified.
-        5. Appends the trimmed or original filename to the file list.
-        6. Concatenates the files if there are more than one in the file list.
+        4. Appends the file to the file list, in config order.
+        5. Concatenates the files if there are more than one in the file list. Start and
+           end timestamps are passed to the concat demuxer as `inpoint`/`outpoint`, so
+           trimming and concatenation happen in a single ffmpeg run. Untrimmed files which
+           are HEVC/AAC and share stream parameters are stream copied rather than re-encoded.
+           The concatenation is skipped if join.txt is unchanged and output.mp4 is newer
+           than all of the files.
+        6. Otherwise trims the single file if start or end timestamps are specified.
 
     Logging:
         Logs the details of each file and the trimming process.
 
     Calls:
-        do_trim(file_info, output_name): Trims the video file if required.
-        write_join_file("join.txt", file_list): Writes the filenames to a join file for concatenation.
+        do_trim(file_info, output_name): Trims a single video file if required.
+        write_join_file("join.txt", file_list): Writes the files to a join file for concatenation.
         do_concat("join.txt", "output.mp4"): Concatenates the video files into a single output file.
     """
     file_list = []
@@ -258,17 +646,45 @@ def process_config(config_dict, skip_encode):
         logging.info('    Start: %s', file_info.start_ts)
         logging.info('    End: %s', file_info.end_ts)
 
-        # trim files if required
-        if file_info.start_ts or file_info.end_ts:
-            do_trim(file_info, file_info.trimmed_video_filename())
-            file_list.append(file_info.trimmed_video_filename())
-        else:
-            file_list.append(file_info.filename)
+        file_list.append(file_info)
 
-        # concatenate video files
+    # concatenate video files, trimming them on the way in
     if len(file_list) > 1:
-        write_join_file("join.txt", file_list)
-        do_concat("join.txt", "output.mp4", skip_encode=skip_encode)
+        # the options are recorded in the join file so changing them forces a new concat
+        options = (f"skip_encode={skip_encode} force_reencode={force_reencode} "
+                   f"hw_decode={hw_decode}")
+        join_changed = write_join_file("join.txt", file_list, comment=options)
+        if not join_changed and _is_newer_than(
+                "output.mp4", [file_info.filename for file_info in file_list]):
+            logging.info('output.mp4 is up to date with join.txt, skipping concatenation.')
+            return
+
+        concat_succeeded = False
+        try:
+            # stream copy cuts on keyframes, so only take the fast path when nothing is trimmed
+            if (not skip_encode and not force_reencode
+                    and not any(file_info.start_ts or file_info.end_ts for file_info in file_list)
+                    and can_stream_copy([file_info.filename for file_info in file_list])):
+                logging.info(
+                    'Input files are HEVC/AAC with matching parameters, concatenating '
+                    'without encoding.')
+                skip_encode = True
+                video_tag = "hvc1"
+            else:
+                video_tag = None
+
+            return_code = do_concat("join.txt", "output.mp4", skip_encode=skip_encode,
+                                    hw_decode=hw_decode, video_tag=video_tag)
+            concat_succeeded = return_code == 0
+            if not concat_succeeded:
+                logging.error('Concatenation failed with return code %s.', return_code)
+        finally:
+            # a partial output.mp4 left by a failed or interrupted concat must not be
+            # mistaken for an up to date one on the next run
+            if not concat_succeeded:
+                os.remove("join.txt")
+    elif file_list and (file_list[0].start_ts or file_list[0].end_ts):
+        do_trim(file_list[0], file_list[0].trimmed_video_filename())
 
 
 @click.command()
@@ -277,7 +693,11 @@ def process_config(config_dict, skip_encode):
 @click.option('--generate-config', 'generate_config', is_flag=True)
 @click.option('--use-config', 'use_config', is_flag=True)
 @click.option('--skip-encode', 'skip_encode', is_flag=True)
-def main(generate_config, use_config, skip_encode, debug):
+@click.option('--force-reencode', 'force_reencode', is_flag=True,
+              help='Re-encode even if the input files could be stream copied.')
+@click.option('--no-hw-decode', 'hw_decode', is_flag=True, flag_value=False, default=True,
+              help='Decode on the CPU when re-encoding, for inputs NVDEC cannot decode.')
+def main(generate_config, use_config, skip_encode, force_reencode, hw_decode, debug):
     """
     Concatenates video files in the current directory.
     """
@@ -287,8 +707,8 @@ def main(generate_config, use_config, skip_encode, debug):
 
     logging.info('Running version %s', __version__)
 
-    files = collect_files(directory='.', pattern=r".*\.mp4")
     if generate_config:
+        files = collect_files(directory='.')
         yaml_dict = {
             'codec': 'hevc_nvenc',
             'files': {
@@ -304,7 +724,8 @@ def main(generate_config, use_config, skip_encode, debug):
         logging.info(config_dict)
 
         os.makedirs('concat', exist_ok=True)
-        process_config(config_dict, skip_encode=skip_encode)
+        process_config(config_dict, skip_encode=skip_encode, force_reencode=force_reencode,
+                       hw_decode=hw_decode)
         return
 
 